@@ -262,8 +262,8 @@ class _AdminLogIter(RequestIter):
             if not utils.is_list_like(admins):
                 admins = (admins,)
 
-            for admin in admins:
-                admin_list.append(await self.client.get_input_entity(admin))
+            admin_list = await helpers._gather_or_cancel(
+                *(self.client.get_input_entity(admin) for admin in admins))
 
         self.request = functions.channels.GetAdminLogRequest(
             self.entity, q=search or '', min_id=min_id, max_id=max_id,
@@ -330,17 +330,18 @@ class UserMethods:
         single = not utils.is_list_like(entity)
         if single:
             entity = (entity,)
+        else:
+            # May be a generator, which can only be iterated once
+            entity = list(entity)
 
         # Group input entities by string (resolve username),
         # input users (get users), input chat (get chats) and
         # input channels (get channels) to get the most entities
         # in the less amount of calls possible.
-        inputs = []
-        for x in entity:
-            if isinstance(x, str):
-                inputs.append(x)
-            else:
-                inputs.append(await self.get_input_entity(x))
+        resolved = iter(await helpers._gather_or_cancel(*(
+            self.get_input_entity(x) for x in entity if not isinstance(x, str)
+        )))
+        inputs = [x if isinstance(x, str) else next(resolved) for x in entity]
 
         lists = {
             helpers._EntityType.USER: [],
@@ -3,10 +3,12 @@ Simple HTML -> Telegram entity parser.
 """
 import re
 import struct
+from bisect import bisect_left
 from collections import deque
 from html import escape
 from html.parser import HTMLParser
-from typing import Optional, Tuple, List, Generator, List, Optional, cast
+from operator import attrgetter
+from typing import Optional, Tuple, List, cast
 from abc import ABC, abstractmethod
 
 from .. import helpers
@@ -21,25 +23,58 @@ from ..tl.types import (
 
 # Helpers from markdown.py
 def _add_surrogate(text):
-    return ''.join(
-        ''.join(chr(y) for y in struct.unpack('<HH', x.encode('utf-16le')))
-        if (0x10000 <= ord(x) <= 0x10FFFF) else x for x in text
-    )
+    if text.isascii():
+        return text
+
+    encoded = text.encode('utf-16le', 'surrogatepass')
+    if len(encoded) == 2 * len(text):
+        # Only BMP characters, there are no surrogate pairs to produce.
+        return text
+
+    # Unpack every UTF-16 code unit at once, so that SMP characters turn
+    # into their surrogate pairs (Telegram offsets are calculated with these).
+    return ''.join(map(chr, struct.unpack(f'<{len(encoded) // 2}H', encoded)))
 
 
 def _del_surrogate(text):
     return text.encode('utf-16', 'surrogatepass').decode('utf-16')
 
 
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+_EMOJI_WRAP_RE = re.compile(r'^<emoji document_id="?\d+?"?>[^<]*?</emoji>$')
+
+# Tags that map directly onto an entity type, plus its default arguments.
+_TAG_ENTITY = {
+    'strong': (MessageEntityBold, None),
+    'b': (MessageEntityBold, None),
+    'em': (MessageEntityItalic, None),
+    'i': (MessageEntityItalic, None),
+    'tg-spoiler': (MessageEntitySpoiler, None),
+    'u': (MessageEntityUnderline, None),
+    'del': (MessageEntityStrike, None),
+    's': (MessageEntityStrike, None),
+    'blockquote': (MessageEntityBlockquote, None),
+    'pre': (MessageEntityPre, {'language': ''}),
+}
+
+
 class HTMLToTelegramParser(HTMLParser):
     def __init__(self):
         super().__init__()
-        self.text = ''
         self.entities = []
+        self._chunks = []
+        self._text_len = 0
         self._building_entities = {}
         self._open_tags = deque()
         self._open_tags_meta = deque()
 
+    @property
+    def text(self):
+        """
+        The text parsed so far, without any of the HTML tags.
+        """
+        return ''.join(self._chunks)
+
     def handle_starttag(self, tag, attrs):
         self._open_tags.appendleft(tag)
         self._open_tags_meta.appendleft(None)
@@ -47,18 +82,11 @@ class HTMLToTelegramParser(HTMLParser):
         attrs = dict(attrs)
         EntityType = None
         args = {}
-        if tag in ["strong", "b"]:
-            EntityType = MessageEntityBold
-        elif tag in ["em", "i"]:
-            EntityType = MessageEntityItalic
-        elif tag in ["tg-spoiler"]:
-            EntityType = MessageEntitySpoiler
-        elif tag == 'u':
-            EntityType = MessageEntityUnderline
-        elif tag in ["del", "s"]:
-            EntityType = MessageEntityStrike
-        elif tag == 'blockquote':
-            EntityType = MessageEntityBlockquote
+        spec = _TAG_ENTITY.get(tag)
+        if spec:
+            EntityType, defaults = spec
+            if defaults:
+                args.update(defaults)
         elif tag == 'code':
             try:
                 # If we're in the middle of a <pre> tag, this <code> tag is
@@ -74,9 +102,6 @@ class HTMLToTelegramParser(HTMLParser):
                     pass
             except KeyError:
                 EntityType = MessageEntityCode
-        elif tag == 'pre':
-            EntityType = MessageEntityPre
-            args["language"] = ''
         elif tag == 'a':
             try:
                 url = attrs['href']
@@ -100,7 +125,7 @@ class HTMLToTelegramParser(HTMLParser):
 
         if EntityType and tag not in self._building_entities:
             self._building_entities[tag] = EntityType(
-                offset=len(self.text),
+                offset=self._text_len,
                 # The length will be determined when closing the tag.
                 length=0,
                 **args)
@@ -112,10 +137,8 @@ class HTMLToTelegramParser(HTMLParser):
             if url:
                 text = url
 
-        for tag, entity in self._building_entities.items():
-            entity.length += len(text)
-
-        self.text += text
+        self._chunks.append(text)
+        self._text_len += len(text)
 
     def handle_endtag(self, tag):
         try:
@@ -125,6 +148,7 @@ class HTMLToTelegramParser(HTMLParser):
             pass
         entity = self._building_entities.pop(tag, None)
         if entity:
+            entity.length = self._text_len - entity.offset
             self.entities.append(entity)
 
 
@@ -139,6 +163,10 @@ def parse(html: str) -> Tuple[str, List[TypeMessageEntity]]:
     if not html:
         return html, []
 
+    if '<' not in html and '&' not in html:
+        # No tags nor character references, so the text stays as-is.
+        return html.strip(), []
+
     parser = HTMLToTelegramParser()
     parser.feed(_add_surrogate(html))
     text = helpers.strip_text(parser.text, parser.entities)
@@ -147,6 +175,36 @@ def parse(html: str) -> Tuple[str, List[TypeMessageEntity]]:
 
 CUSTOM_EMOJIS = True  # Can be disabled externally
 
+# Entities which are unparsed by wrapping the text with a single method
+_ENTITY_METHODS = {
+    MessageEntityBold: "bold",
+    MessageEntityItalic: "italic",
+    MessageEntitySpoiler: "spoiler",
+    MessageEntityCode: "code",
+    MessageEntityUnderline: "underline",
+    MessageEntityStrike: "strikethrough",
+}
+
+
+class _UnparseFrame:
+    """
+    State of one nesting level while unparsing, with ``entity`` being the
+    entity whose content is being built (`None` for the whole text).
+
+    ``index`` is the next entity to visit, up to ``end_index``, and
+    ``offset`` is how far ``length`` has been emitted (in UTF-16 units).
+    """
+    __slots__ = ('index', 'end_index', 'offset', 'length', 'entity', 'parts')
+
+    def __init__(self, index, end_index, offset, length, entity):
+        self.index = index
+        self.end_index = end_index
+        self.offset = offset
+        self.length = length
+        self.entity = entity
+        self.parts = []
+
+
 # Based on https://github.com/aiogram/aiogram/blob/c43ff9b6f9dd62cd2d84272e5c460b904b4c3276/aiogram/utils/text_decorations.py
 
 
@@ -158,34 +216,28 @@ class TextDecoration(ABC):
         :param text:
         :return:
         """
-        entity_map = {
-            MessageEntityBold: "bold",
-            MessageEntityItalic: "italic",
-            MessageEntitySpoiler: "spoiler",
-            MessageEntityCode: "code",
-            MessageEntityUnderline: "underline",
-            MessageEntityStrike: "strikethrough",
-        }
-        if type(entity) in entity_map:
-            if re.match(r"^<emoji document_id=\"?\d+?\"?>[^<]*?<\/emoji>$", text):
+        entity_type = type(entity)
+        method = _ENTITY_METHODS.get(entity_type)
+        if method:
+            if _EMOJI_WRAP_RE.match(text):
                 return text
 
-            return cast(str, getattr(self, entity_map[type(entity)])(value=text))
-        if type(entity) == MessageEntityPre:
+            return cast(str, getattr(self, method)(value=text))
+        if entity_type is MessageEntityPre:
             return (
                 self.pre_language(value=text, language=entity.language)
                 if entity.language
                 else self.pre(value=text)
             )
-        if type(entity) == MessageEntityMentionName:
+        if entity_type is MessageEntityMentionName:
             return self.link(value=text, link=f"tg://user?id={entity.user_id}")
-        if type(entity) == MessageEntityTextUrl:
+        if entity_type is MessageEntityTextUrl:
             return self.link(value=text, link=cast(str, entity.url))
-        if type(entity) == MessageEntityUrl:
+        if entity_type is MessageEntityUrl:
             return self.link(value=text, link=text)
-        if type(entity) == MessageEntityEmail:
+        if entity_type is MessageEntityEmail:
             return self.link(value=text, link=f"mailto:{text}")
-        if type(entity) == MessageEntityCustomEmoji and CUSTOM_EMOJIS:
+        if entity_type is MessageEntityCustomEmoji and CUSTOM_EMOJIS:
             return self.custom_emoji(value=text, document_id=entity.document_id)
 
         return self.quote(text)
@@ -197,56 +249,81 @@ class TextDecoration(ABC):
         :param entities: Array of MessageEntities
         :return:
         """
-        return "".join(
-            self._unparse_entities(
-                self._add_surrogates(text),
-                sorted(entities, key=lambda item: item.offset) if entities else [],
-            )
-        )
-
-    def _unparse_entities(
-        self,
-        text: bytes,
-        entities: list,
-        offset: Optional[int] = None,
-        length: Optional[int] = None,
-    ) -> Generator[str, None, None]:
-        if offset is None:
-            offset = 0
-        length = length or len(text)
-
-        for index, entity in enumerate(entities):
-            if entity.offset * 2 < offset:
+        if not entities:
+            entities = []
+        elif not isinstance(entities, list) or any(
+            entities[i].offset > entities[i + 1].offset
+            for i in range(len(entities) - 1)
+        ):
+            # Entities coming from the parser are usually in order already.
+            entities = sorted(entities, key=attrgetter("offset"))
+
+        return self._unparse_entities(text, entities)
+
+    def _unparse_entities(self, text: str, entities: list) -> str:
+        # Entity offsets are given in UTF-16 code units. Every astral
+        # character before an offset counts twice, so subtracting how many
+        # of them come before it gives the index into the original string.
+        astral = self._astral_offsets(text)
+        last = len(text) + len(astral)
+
+        def piece(start, end):
+            start, end = min(start, last), min(end, last)
+            if astral:
+                start -= bisect_left(astral, start)
+                end -= bisect_left(astral, end)
+            return text[start:end]
+
+        # ``entities`` is sorted by offset, so the entities starting inside
+        # any given one always form a contiguous run right after it, which
+        # can be found with a bisection instead of re-filtering the list.
+        offsets = [entity.offset for entity in entities]
+        stack = [_UnparseFrame(0, len(entities), 0, last, None)]
+        while True:
+            frame = stack[-1]
+            offset = frame.offset
+            if frame.index < frame.end_index:
+                index = frame.index
+                entity = entities[index]
+                frame.index = index + 1
+                start = entity.offset
+                if start < offset:
+                    continue
+                if start > offset:
+                    frame.parts.append(self.quote(piece(offset, start)))
+
+                end = entity.offset + entity.length
+                frame.offset = end
+                stack.append(_UnparseFrame(
+                    index + 1,
+                    bisect_left(offsets, end, index + 1, frame.end_index),
+                    start,
+                    end or last,
+                    entity,
+                ))
                 continue
-            if entity.offset * 2 > offset:
-                yield self.quote(
-                    self._remove_surrogates(text[offset : entity.offset * 2])
-                )
-            start = entity.offset * 2
-            offset = entity.offset * 2 + entity.length * 2
-
-            sub_entities = list(
-                filter(lambda e: e.offset * 2 < (offset or 0), entities[index + 1 :])
-            )
-            yield self.apply_entity(
-                entity,
-                "".join(
-                    self._unparse_entities(
-                        text, sub_entities, offset=start, length=offset
-                    )
-                ),
-            )
 
-        if offset < length:
-            yield self.quote(self._remove_surrogates(text[offset:length]))
+            if offset < frame.length:
+                frame.parts.append(self.quote(piece(offset, frame.length)))
 
-    @staticmethod
-    def _add_surrogates(text: str):
-        return text.encode("utf-16-le")
+            stack.pop()
+            if not stack:
+                return "".join(frame.parts)
+
+            stack[-1].parts.append(
+                self.apply_entity(frame.entity, "".join(frame.parts))
+            )
 
     @staticmethod
-    def _remove_surrogates(text: bytes):
-        return text.decode("utf-16-le")
+    def _astral_offsets(text: str) -> list:
+        """
+        UTF-16 code unit offsets of the astral characters in ``text``,
+        which take up two code units (a surrogate pair) each.
+        """
+        if text.isascii():
+            return []
+
+        return [m.start() + i for i, m in enumerate(_ASTRAL_RE.finditer(text))]
 
     @abstractmethod
     def link(self, value: str, link: str) -> str:  # pragma: no cover
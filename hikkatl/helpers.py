@@ -163,6 +163,19 @@ async def _maybe_await(value):
         return value
 
 
+async def _gather_or_cancel(*aws):
+    """
+    Like `asyncio.gather`, but cancels the remaining awaitables if one fails.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
 async def _cancel(log, **tasks):
     """
     Helper to cancel one or more tasks gracefully, logging exceptions.
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from hikkatl import TelegramClient, types
+
+
+class MockedClient(TelegramClient):
+    # noinspection PyMissingConstructor
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.cancelled = []
+
+    async def get_input_entity(self, peer):
+        if peer == self.fail:
+            raise ValueError(peer)
+
+        try:
+            await asyncio.sleep(0.01 if self.fail is not None else 0)
+        except asyncio.CancelledError:
+            self.cancelled.append(peer)
+            raise
+
+        return types.InputPeerUser(peer, 0)
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        return [types.User(id=x.user_id) for x in request.id]
+
+    async def _get_entity_from_string(self, string):
+        return types.User(id=len(string), username=string)
+
+
+@pytest.mark.asyncio
+async def test_get_entity_list():
+    client = MockedClient()
+    result = await client.get_entity([1, 2])
+    assert [u.id for u in result] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_get_entity_generator():
+    client = MockedClient()
+    result = await client.get_entity(x for x in [1, 2])
+    assert [u.id for u in result] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_get_entity_mixed_keeps_order():
+    client = MockedClient()
+    result = await client.get_entity([5, 'abc', 7])
+    assert [(u.id, u.username) for u in result] == [(5, None), (3, 'abc'), (7, None)]
+
+
+@pytest.mark.asyncio
+async def test_get_entity_cancels_pending_lookups():
+    client = MockedClient(fail=2)
+    with pytest.raises(ValueError):
+        await client.get_entity([1, 2, 3])
+
+    await asyncio.sleep(0)
+    assert sorted(client.cancelled) == [1, 3]
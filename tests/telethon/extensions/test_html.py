@@ -2,7 +2,10 @@
 Tests for `telethon.extensions.html`.
 """
 from hikkatl.extensions import html
-from telethon.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl
+from hikkatl.tl.types import (
+    MessageEntityBold, MessageEntityCode, MessageEntityItalic, MessageEntityTextUrl,
+    MessageEntityUnderline
+)
 
 
 def test_entity_edges():
@@ -12,7 +15,7 @@ def test_entity_edges():
     text = 'Hello, world'
     entities = [MessageEntityBold(0, 5), MessageEntityBold(7, 5)]
     result = html.unparse(text, entities)
-    assert result == '<strong>Hello</strong>, <strong>world</strong>'
+    assert result == '<b>Hello</b>, <b>world</b>'
 
 
 def test_malformed_entities():
@@ -42,7 +45,7 @@ def test_entities_together():
     """
     Test that an entity followed immediately by a different one behaves well.
     """
-    original = '<strong>⚙️</strong><em>Settings</em>'
+    original = '<b>⚙️</b><i>Settings</i>'
     stripped = '⚙️Settings'
 
     text, entities = html.parse(original)
@@ -59,7 +62,83 @@ def test_offset_at_emoji():
     """
     text = 'Hi\n👉 See example'
     entities = [MessageEntityBold(0, 2), MessageEntityItalic(3, 2), MessageEntityBold(10, 7)]
-    parsed = '<strong>Hi</strong>\n<em>👉</em> See <strong>example</strong>'
+    parsed = '<b>Hi</b>\n<i>👉</i> See <b>example</b>'
 
     assert html.parse(parsed) == (text, entities)
     assert html.unparse(text, entities) == parsed
+
+
+def test_plain_text():
+    """
+    Test that text without any markup is returned stripped and without entities.
+    """
+    assert html.parse('  Hello, 🏆 world\n') == ('Hello, 🏆 world', [])
+    assert html.parse('a &amp; b') == ('a & b', [])
+
+
+def test_unparse_nested_entities():
+    """
+    Test that entities inside other entities are nested in the output.
+    """
+    text = 'abcdef'
+    entities = [MessageEntityBold(0, 6), MessageEntityItalic(1, 4), MessageEntityUnderline(2, 2)]
+    assert html.unparse(text, entities) == '<b>a<i>b<u>cd</u>e</i>f</b>'
+
+
+def test_unparse_overlapping_entities():
+    """
+    Test that overlapping entities don't crash. The second one is nested
+    inside the first, and the text past the first one is emitted again.
+    """
+    text = 'abcdef'
+    entities = [MessageEntityBold(0, 4), MessageEntityItalic(2, 4)]
+    assert html.unparse(text, entities) == '<b>ab<i>cdef</i></b>ef'
+
+
+def test_unparse_out_of_range_entities():
+    """
+    Test that entities past the end of the text don't crash.
+    """
+    text = 'abc'
+    entities = [MessageEntityBold(1, 10), MessageEntityItalic(5, 2)]
+    assert html.unparse(text, entities) == 'a<b>bc<i></i></b>'
+
+
+def test_unparse_zero_length_entities():
+    """
+    Test that empty entities are kept without swallowing the next one.
+    """
+    text = 'abc'
+    entities = [MessageEntityBold(1, 0), MessageEntityItalic(1, 1)]
+    assert html.unparse(text, entities) == 'a<b></b><i>b</i>c'
+
+
+def test_unparse_astral_offsets():
+    """
+    Test that offsets count emoji as two UTF-16 code units, and that an
+    offset inside an emoji doesn't split it.
+    """
+    text = 'a🏆b🏆c'
+    entities = [MessageEntityBold(1, 2), MessageEntityItalic(4, 3), MessageEntityUnderline(6, 1)]
+    assert html.unparse(text, entities) == 'a<b>🏆</b>b<i>🏆<u>c</u></i>'
+    assert html.unparse('🏆x', [MessageEntityBold(1, 2)]) == '<b>🏆x</b>'
+
+
+def test_unparse_unsorted_entities():
+    """
+    Test that entities are applied by offset regardless of their order.
+    """
+    text = '<a&b>'
+    entities = [MessageEntityItalic(4, 1), MessageEntityCode(1, 2)]
+    assert html.unparse(text, entities) == '&lt;<code>a&amp;</code>b<i>&gt;</i>'
+
+
+def test_parser_text():
+    """
+    Test that the parser exposes the text parsed so far without the tags.
+    """
+    parser = html.HTMLToTelegramParser()
+    parser.feed('<b>Hello</b>, ')
+    assert parser.text == 'Hello, '
+    parser.feed('<i>world</i>')
+    assert parser.text == 'Hello, world'
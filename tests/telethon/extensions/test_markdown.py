@@ -1,65 +1,75 @@
 """
 Tests for `telethon.extensions.markdown`.
 """
-from hikkatl.extensions import markdown
-from telethon.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl
-
-
-def test_entity_edges():
-    """
-    Test that entities at the edges (start and end) don't crash.
-    """
-    text = 'Hello, world'
-    entities = [MessageEntityBold(0, 5), MessageEntityBold(7, 5)]
-    result = markdown.unparse(text, entities)
-    assert result == '**Hello**, **world**'
-
+import pytest
 
-def test_malformed_entities():
-    """
-    Test that malformed entity offsets from bad clients
-    don't crash and produce the expected results.
-    """
-    text = '🏆Telegram Official Android Challenge is over🏆.'
-    entities = [MessageEntityTextUrl(offset=2, length=43, url='https://example.com')]
-    result = markdown.unparse(text, entities)
-    assert result == "🏆[Telegram Official Android Challenge is over](https://example.com)🏆."
-
-
-def test_trailing_malformed_entities():
-    """
-    Similar to `test_malformed_entities`, but for the edge
-    case where the malformed entity offset is right at the end
-    (note the lack of a trailing dot in the text string).
-    """
-    text = '🏆Telegram Official Android Challenge is over🏆'
-    entities = [MessageEntityTextUrl(offset=2, length=43, url='https://example.com')]
-    result = markdown.unparse(text, entities)
-    assert result == "🏆[Telegram Official Android Challenge is over](https://example.com)🏆"
+from hikkatl.extensions import markdown
+from hikkatl.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl
 
 
-def test_entities_together():
+def _sig(entities):
     """
-    Test that an entity followed immediately by a different one behaves well.
+    Cheap structural signature of entities, to avoid `TLObject.__eq__`.
     """
-    original = '**⚙️**__Settings__'
-    stripped = '⚙️Settings'
+    return [(type(e).__name__, e.offset, e.length, getattr(e, 'url', None))
+            for e in entities]
 
-    text, entities = markdown.parse(original)
-    assert text == stripped
-    assert entities == [MessageEntityBold(0, 2), MessageEntityItalic(2, 8)]
 
-    text = markdown.unparse(text, entities)
-    assert text == original
+# (text, entities, markdown, direction), built once at import time.
+#
+# "unparse" cases only check that unparsing produces the markdown, while
+# "roundtrip" cases also check that parsing the markdown gives them back.
+CASES = [
+    # Entities at the edges (start and end) don't crash.
+    pytest.param(
+        'Hello, world',
+        [MessageEntityBold(0, 5), MessageEntityBold(7, 5)],
+        '**Hello**, **world**',
+        'unparse',
+        id='entity_edges',
+    ),
+    # Malformed entity offsets from bad clients don't crash
+    # and produce the expected results.
+    pytest.param(
+        '🏆Telegram Official Android Challenge is over🏆.',
+        [MessageEntityTextUrl(offset=2, length=43, url='https://example.com')],
+        '🏆[Telegram Official Android Challenge is over](https://example.com)🏆.',
+        'unparse',
+        id='malformed_entities',
+    ),
+    # Same as above, but for the edge case where the malformed entity offset
+    # is right at the end (note the lack of a trailing dot in the text).
+    pytest.param(
+        '🏆Telegram Official Android Challenge is over🏆',
+        [MessageEntityTextUrl(offset=2, length=43, url='https://example.com')],
+        '🏆[Telegram Official Android Challenge is over](https://example.com)🏆',
+        'unparse',
+        id='trailing_malformed_entities',
+    ),
+    # An entity followed immediately by a different one behaves well.
+    pytest.param(
+        '⚙️Settings',
+        [MessageEntityBold(0, 2), MessageEntityItalic(2, 8)],
+        '**⚙️**__Settings__',
+        'roundtrip',
+        id='entities_together',
+    ),
+    # An entity starting at a emoji preserves the emoji.
+    pytest.param(
+        'Hi\n👉 See example',
+        [MessageEntityBold(0, 2), MessageEntityItalic(3, 2), MessageEntityBold(10, 7)],
+        '**Hi**\n__👉__ See **example**',
+        'roundtrip',
+        id='offset_at_emoji',
+    ),
+]
 
 
-def test_offset_at_emoji():
-    """
-    Tests that an entity starting at a emoji preserves the emoji.
-    """
-    text = 'Hi\n👉 See example'
-    entities = [MessageEntityBold(0, 2), MessageEntityItalic(3, 2), MessageEntityBold(10, 7)]
-    parsed = '**Hi**\n__👉__ See **example**'
+@pytest.mark.parametrize('text,entities,expected,direction', CASES)
+def test_markdown(text, entities, expected, direction):
+    if direction == 'roundtrip':
+        parsed_text, parsed_entities = markdown.parse(expected)
+        assert parsed_text == text
+        assert _sig(parsed_entities) == _sig(entities)
 
-    assert markdown.parse(parsed) == (text, entities)
-    assert markdown.unparse(text, entities) == parsed
+    assert markdown.unparse(text, entities) == expected